@@ -6,50 +6,133 @@
 # Safe text wrapper included for Streamlit Cloud stability.
 
 import io
+import atexit
 import math
-import textwrap
+import functools
+import hashlib
+import json
 import tempfile
+import textwrap
+import threading
+import time
 import requests
 import os
-from PIL import Image, ImageDraw
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
+from PIL import Image
 import streamlit as st
 import ezdxf
-from ezdxf.math import Vec2
-from ezdxf.addons.drawing import RenderContext, Frontend
-from ezdxf.addons.drawing.matplotlib import MatplotlibBackend
-import matplotlib.pyplot as plt
+from ezdxf.enums import TextEntityAlignment
+from ezdxf.colors import aci2rgb
 
 # ---------------- Helper: safe text add (avoids small-float crashes on Cloud) ----------------
+@functools.lru_cache(maxsize=None)
+def _text_attrs(height, layer):
+    # one shared dxfattribs dict per (height, layer); ezdxf copies it into each entity
+    return {"height": height, "layer": layer}
+
 def safe_add_text(msp, content, height, pos, layer="TEXT", align="LEFT"):
     """
-    Safe text creation for all ezdxf >=1.0 (handles missing set_pos / set_align)
+    Safe text creation for all ezdxf >=1.0; align is a TextEntityAlignment name
+    (LEFT, MIDDLE_CENTER, RIGHT, ...) applied with set_placement.
     """
     try:
-        text = msp.add_text(
-            content,
-            dxfattribs={
-                "height": float(height),
-                "layer": layer,
-            },
-        )
-        # Directly set insertion coordinates
-        text.dxf.insert = (float(pos[0]), float(pos[1]))
-
-        # Optional alignment (works in modern ezdxf)
-        try:
-            text.set_alignment(align)
-        except Exception:
-            # Ignore if not supported in this ezdxf build
-            pass
-
+        text = msp.add_text(content, dxfattribs=_text_attrs(float(height), layer))
+        text.set_placement((float(pos[0]), float(pos[1])), align=TextEntityAlignment[align])
         return text
     except Exception as e:
         st.warning(f"⚠️ Skipped text '{content[:25]}...': {e}")
         return None
 
+def add_text_fast(msp, content, x, y, attrs, align="LEFT"):
+    """
+    Text at a position computed by the layout (not user-driven): no coercion or try/except;
+    attrs is one of the module-level TEXT_ATTRS_* dicts.
+    """
+    text = msp.add_text(content, dxfattribs=attrs)
+    text.set_placement((x, y), align=TextEntityAlignment[align])
+    return text
+
+# ---------------- Helper: centred text with a shared attribute dict (table cells, labels) ----------------
+def add_centered_text(msp, content, x, y, attrs):
+    # attrs is one of the module-level TEXT_ATTRS_* dicts, so no dict is built per call
+    text = msp.add_text(content, dxfattribs=attrs)
+    text.set_placement((x, y), align=TextEntityAlignment.MIDDLE_CENTER)
+    return text
+
+# ---------------- Helper: closed rectangle in mm -> DXF polyline points in metres ----------------
+# (plain (x, y) pairs: pass format="xy" so ezdxf reads them directly instead of as its default "xyseb" layout)
+M_PER_MM = 0.001  # sheet layout is in mm, DXF units are metres
+
+def rect_m(x_mm, y_mm, w_mm, h_mm):
+    x0, y0 = x_mm * M_PER_MM, y_mm * M_PER_MM
+    x1, y1 = (x_mm + w_mm) * M_PER_MM, (y_mm + h_mm) * M_PER_MM
+    return [(x0, y0), (x1, y0), (x1, y1), (x0, y1), (x0, y0)]
+
+
+# ---------------- Helper: buffer circle over an inserted map image (vector, not rastered) ----------------
+def _ellipse_spans_in_box(cx, cy, rx, ry, x0, y0, x1, y1):
+    # angle spans (start, end) of the ellipse (cx + rx cos a, cy + ry sin a) that lie inside the box:
+    # cut the ellipse where it crosses the box edges and keep the pieces whose midpoint is inside
+    inside = lambda a: (x0 <= cx + rx*math.cos(a) <= x1) and (y0 <= cy + ry*math.sin(a) <= y1)
+    cuts = set()
+    for x in (x0, x1):
+        c = (x - cx) / rx
+        if abs(c) < 1:
+            cuts.update((math.acos(c), -math.acos(c)))
+    for y in (y0, y1):
+        sn = (y - cy) / ry
+        if abs(sn) < 1:
+            cuts.update((math.asin(sn), math.pi - math.asin(sn)))
+    cuts = sorted(a % (2*math.pi) for a in cuts)
+    if not cuts:
+        return [(0.0, 2*math.pi)] if inside(0.0) else []
+    spans = zip(cuts, cuts[1:] + [cuts[0] + 2*math.pi])
+    return [(a, b) for a, b in spans if b - a > 1e-9 and inside((a + b) / 2)]
+
+def add_buffer_overlay(msp, center_px, radius_px, size_px, insert, size_units):
+    # image pixels -> model units; pixel rows run top-down, model y runs bottom-up
+    kx, ky = size_units[0] / size_px[0], size_units[1] / size_px[1]
+    cx = insert[0] + center_px[0]*kx
+    cy = insert[1] + (size_px[1] - center_px[1])*ky
+    rx, ry = radius_px[0]*kx, radius_px[1]*ky
+    # DXF wants the major axis first (ratio <= 1); its parameter starts on the major axis,
+    # so a vertical major axis shifts the x-based angles by a quarter turn
+    if rx >= ry:
+        major, ratio, shift = (rx, 0), ry / rx, 0.0
+    else:
+        major, ratio, shift = (0, ry), rx / ry, math.pi / 2
+    # clipped to the image, so a large buffer never runs over the rest of the sheet
+    x1, y1 = insert[0] + size_units[0], insert[1] + size_units[1]
+    for a, b in _ellipse_spans_in_box(cx, cy, rx, ry, insert[0], insert[1], x1, y1):
+        msp.add_ellipse((cx, cy), major_axis=major, ratio=ratio, start_param=a - shift, end_param=b - shift,
+                        dxfattribs=BUFFER_ATTRS)
+    msp.add_circle((cx, cy), 0.0005, dxfattribs=BORDER_LINE_ATTRS)  # centre marker
 
 
 # ---------------- Map utilities (OSM tile stitching for keyplan/ADLR) ----------------
+# shared HTTP session for tiles: keep-alive connections and retries on transient errors.
+# cache_resource keeps one session per process, so connections also survive Streamlit reruns.
+# concurrent tile downloads (key plan + ADLR = 2 x 9 tiles); the HTTP pool is sized to match
+TILE_WORKERS = 18
+
+@st.cache_resource
+def _http_session():
+    session = requests.Session()
+    session.headers.update({"User-Agent": "SingleSitePlan/1.0"})
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=TILE_WORKERS, max_retries=retry))
+    return session
+
+SESSION = _http_session()
+# on-disk tile cache, reused across reruns and sessions
+TILE_CACHE_DIR = Path(tempfile.gettempdir()) / "ossp_tiles"
+GEOCODE_CACHE_DIR = Path(tempfile.gettempdir()) / "ossp_geocode"
+
 def latlon_to_tile_xy(lat_deg, lon_deg, zoom):
     lat_rad = math.radians(lat_deg)
     n = 2.0 ** zoom
@@ -57,43 +140,637 @@ def latlon_to_tile_xy(lat_deg, lon_deg, zoom):
     ytile = (1.0 - math.log(math.tan(lat_rad) + 1 / math.cos(lat_rad)) / math.pi) / 2.0 * n
     return xtile, ytile
 
-def fetch_tile_image(z, x, y, scale=2):
+# one sheet's worth of decoded tiles (2 x 9, ~0.75 MB each at @2x); stitch_tiles caches the
+# mosaics, so this only has to cover a single build
+@functools.lru_cache(maxsize=TILE_WORKERS)
+def _load_tile(z, x, y, scale):
+    # disk cache first, then OSM; raises on failure so errors are never memoized.
+    # OSM tiles are opaque, so RGB (no alpha) all the way through stitching
+    path = TILE_CACHE_DIR / f"{z}/{x}/{y}@{scale}.png"
+    if path.exists():
+        try:
+            return Image.open(path).convert("RGB")
+        except Exception:
+            pass  # corrupt cache entry: refetch below
     # try @2x tiles for better clarity; fallback to normal
     if scale == 2:
         url = f"https://tile.openstreetmap.org/{z}/{x}/{y}@2x.png"
     else:
         url = f"https://tile.openstreetmap.org/{z}/{x}/{y}.png"
-    headers = {"User-Agent": "SingleSitePlan/1.0"}
+    r = SESSION.get(url, timeout=8)
+    r.raise_for_status()
+    img = Image.open(io.BytesIO(r.content)).convert("RGB")
     try:
-        r = requests.get(url, headers=headers, timeout=8)
-        r.raise_for_status()
-        return Image.open(io.BytesIO(r.content)).convert("RGBA")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(r.content)
+    except OSError:
+        pass  # caching is best-effort
+    return img
+
+def fetch_tile_image(z, x, y, scale=2):
+    # None if the tile could not be fetched; the mosaic greys it out
+    try:
+        return _load_tile(z, x, y, scale)
     except Exception:
-        size = 256 * (2 if scale == 2 else 1)
-        return Image.new("RGBA", (size, size), (240,240,240,255))
+        return None
 
-def make_keyplan_image(lat, lon, zoom=16, radius_m=200, tiles_radius=1, scale=2):
-    # Stitch tiles around center and draw a buffer circle
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+# "lat,lon" input, e.g. "12.97, 77.59"; anything else is geocoded as an address
+LATLON_RE = re.compile(r"^\s*([+-]?\d+(?:\.\d*)?)\s*,\s*([+-]?\d+(?:\.\d*)?)\s*$")
+
+@st.cache_resource
+def _nominatim_gate():
+    # process-wide: the Nominatim usage policy allows at most 1 request/s per application
+    return {"lock": threading.Lock(), "last": 0.0}
+
+@st.cache_resource
+def _nominatim_session():
+    # no automatic retries here: they would bypass the 1 request/s gate and keep hammering on a 429
+    session = requests.Session()
+    session.headers.update({"User-Agent": "SingleSitePlan/1.0"})
+    session.mount("https://", HTTPAdapter(max_retries=0))
+    return session
+
+# a failed lookup is remembered briefly, so reruns in the meantime fail fast instead of
+# waiting on Nominatim again
+GEOCODE_RETRY_AFTER_S = 60
+
+@st.cache_resource
+def _geocode_failures():
+    # normalized query -> (time.monotonic() of the failure, exception)
+    return {}
+
+def _nominatim_search(params):
+    gate = _nominatim_gate()
+    with gate["lock"]:
+        wait = 1.0 - (time.monotonic() - gate["last"])
+        if wait > 0:
+            time.sleep(wait)
+        gate["last"] = time.monotonic()
+    r = _nominatim_session().get(NOMINATIM_URL, params={**params, "format":"jsonv2", "limit":1, "addressdetails":0},
+                                 headers={"Accept-Language":"en"}, timeout=8)
+    r.raise_for_status()
+    return r.json()
+
+@st.cache_data(show_spinner=False, ttl=86400)
+def geocode(addr):
+    # Nominatim lookup -> (lat, lon), or None if nothing matched; cached in memory across reruns
+    # and on disk across restarts, keyed by the normalized query. Network/HTTP errors raise
+    # (st.cache_data does not store exceptions); the same error is re-raised without a request
+    # until GEOCODE_RETRY_AFTER_S has passed.
+    query = " ".join(addr.lower().split())
+    path = GEOCODE_CACHE_DIR / f"{hashlib.sha1(query.encode()).hexdigest()}.json"
+    if path.exists():
+        try:
+            return tuple(json.loads(path.read_text()))
+        except Exception:
+            pass  # corrupt cache entry: query again below
+    failures = _geocode_failures()
+    failed = failures.get(query)
+    if failed and time.monotonic() - failed[0] < GEOCODE_RETRY_AFTER_S:
+        raise failed[1]
+    try:
+        data = []
+        # "street, city, country" / "street, city, state, country" -> structured query (fast index path);
+        # other shapes can't be mapped to fields reliably, so they go straight to free text
+        parts = [p.strip() for p in query.split(",") if p.strip()]
+        keys = {3: ("street", "city", "country"), 4: ("street", "city", "state", "country")}.get(len(parts))
+        if keys:
+            data = _nominatim_search({**dict(zip(keys, parts)), "dedupe":0})
+        if not data:
+            data = _nominatim_search({"q":query})
+        if not data:
+            return None
+        latlon = (float(data[0]["lat"]), float(data[0]["lon"]))
+    except (requests.RequestException, ValueError, KeyError) as e:
+        failures[query] = (time.monotonic(), e)
+        raise
+    failures.pop(query, None)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(latlon))
+    except OSError:
+        pass  # caching is best-effort
+    return latlon
+
+class IncompleteMosaic(Exception):
+    # raised out of stitch_tiles so st.cache_data never stores a mosaic with grey fallback tiles;
+    # carries that mosaic for the current build
+    def __init__(self, image):
+        super().__init__("some map tiles could not be fetched")
+        self.image = image
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def stitch_tiles(zoom, x_center, y_center, tiles_radius=1, scale=2, _tile_pool=None):
+    # (2r+1)^2 tile mosaic around a tile index; keyed on the grid only, so the key plan and
+    # ADLR share one mosaic when their zooms coincide (st.cache_data computes a key once,
+    # even when both maps ask for it concurrently)
+    tile_px = 256 * (2 if scale == 2 else 1)
+    cols = 2*tiles_radius + 1
+    # tile grid offsets and their pixel positions in the mosaic, computed in one shot
+    offs = np.arange(-tiles_radius, tiles_radius+1)
+    dxs, dys = (g.ravel() for g in np.meshgrid(offs, offs))
+    paste_x, paste_y = (dxs + tiles_radius) * tile_px, (dys + tiles_radius) * tile_px
+    tile_xy = list(zip((x_center + dxs).tolist(), (y_center + dys).tolist()))
+    # tiles are I/O-bound: fetch them concurrently, then assemble in this thread
+    fetch = lambda t: fetch_tile_image(zoom, t[0], t[1], scale=scale)
+    if _tile_pool is not None:
+        imgs = list(_tile_pool.map(fetch, tile_xy))
+    else:
+        with ThreadPoolExecutor(max_workers=min(len(tile_xy), TILE_WORKERS)) as ex:
+            imgs = list(ex.map(fetch, tile_xy))
+    # copy tiles straight into one array instead of per-tile PIL paste; missing tiles stay grey
+    arr = np.empty((cols*tile_px, cols*tile_px, 3), np.uint8)
+    for c0, r0, img in zip(paste_x.tolist(), paste_y.tolist(), imgs):
+        arr[r0:r0+tile_px, c0:c0+tile_px] = np.asarray(img) if img is not None else 240
+    mosaic = Image.fromarray(arr, "RGB")
+    if any(img is None for img in imgs):
+        raise IncompleteMosaic(mosaic)
+    return mosaic
+
+def make_keyplan_image(lat, lon, zoom=16, radius_m=200, tiles_radius=1, scale=2, target_size=None, tile_pool=None):
+    # Stitch tiles around center and downscale to target_size (px) if given.
+    # Returns (image, center_px, (rx_px, ry_px)): the buffer circle is drawn as DXF vectors by the caller.
+    # tile_pool lets several maps share one fetch executor. Not cached itself: the mosaic is,
+    # and only when every tile came through, so an OSM outage is retried on the next build.
     xtile_f, ytile_f = latlon_to_tile_xy(lat, lon, zoom)
     x_center = int(math.floor(xtile_f)); y_center = int(math.floor(ytile_f))
     tile_px = 256 * (2 if scale == 2 else 1)
-    cols = 2*tiles_radius + 1
-    stitched = Image.new("RGBA", (cols*tile_px, cols*tile_px))
-    for dy in range(-tiles_radius, tiles_radius+1):
-        for dx in range(-tiles_radius, tiles_radius+1):
-            img = fetch_tile_image(zoom, x_center+dx, y_center+dy, scale=scale)
-            stitched.paste(img, ((dx+tiles_radius)*tile_px, (dy+tiles_radius)*tile_px))
+    try:
+        stitched = stitch_tiles(zoom, x_center, y_center, tiles_radius, scale, _tile_pool=tile_pool)
+    except IncompleteMosaic as e:
+        stitched = e.image
     frac_x = (xtile_f - x_center); frac_y = (ytile_f - y_center)
     center_px = (tiles_radius*tile_px + int(frac_x*tile_px), tiles_radius*tile_px + int(frac_y*tile_px))
     # meters per pixel approx for WebMercator
     R = 6378137.0
     mpp = (math.cos(math.radians(lat)) * 2 * math.pi * R) / (tile_px * (2**zoom))
     radius_px = max(3, int(radius_m / mpp))
-    draw = ImageDraw.Draw(stitched)
-    bbox = [center_px[0]-radius_px, center_px[1]-radius_px, center_px[0]+radius_px, center_px[1]+radius_px]
-    draw.ellipse(bbox, outline=(200,0,0,255), width=6)  # thick outline
-    draw.ellipse([center_px[0]-3, center_px[1]-3, center_px[0]+3, center_px[1]+3], fill=(0,0,0,255))
-    return stitched
+    # resize once to the final pixel size; the buffer scales with it (non-uniformly if the aspect changes)
+    sx = sy = 1.0
+    if target_size:
+        sx, sy = target_size[0] / stitched.width, target_size[1] / stitched.height
+        stitched = stitched.resize(target_size, Image.Resampling.BILINEAR)
+    return stitched, (center_px[0]*sx, center_px[1]*sy), (radius_px*sx, radius_px*sy)
+
+# ---------------- Page layout constants (mm) ----------------
+PAGE_W_MM, PAGE_H_MM = 420.0, 297.0
+LEFT, RIGHT, TOP, BOTTOM = 12.0, 12.0, 12.0, 12.0
+INFO_GAP = 15.0
+DRAW_W = PAGE_W_MM * 0.62
+DRAW_H = PAGE_H_MM - TOP - BOTTOM
+DRAW_X = LEFT
+DRAW_Y = BOTTOM
+INFO_X = DRAW_X + DRAW_W + INFO_GAP
+INFO_W = PAGE_W_MM - RIGHT - 2 - INFO_X   # right column, 2 mm clear of the border
+
+# ---------------- Shared DXF attributes (ezdxf copies these, so reuse is safe) ----------------
+BORDER_ATTRS = {"layer":"BORDER", "closed":True}
+BORDER_LINE_ATTRS = {"layer":"BORDER"}
+SITE_ATTRS = {"layer":"SITE", "linetype":"GBA_DASH", "closed":True}
+ROAD_ATTRS = {"layer":"ROAD", "closed":True}
+BUFFER_ATTRS = {"layer":"BORDER", "color":1, "lineweight":50}
+TEXT_ATTRS_H9 = {"layer":"TEXT", "height":0.009}   # road labels, table headers, drawing title
+TEXT_ATTRS_H7 = {"layer":"TEXT", "height":0.007}   # table cells, title block labels
+TEXT_ATTRS_H6 = {"layer":"TEXT", "height":0.006}   # north arrow, dimensions note
+# General Conditions and Notes: 2 mm characters across the full right column; the 15 conditions
+# wrap to ~38 lines (~127 mm at 5/3 line spacing) between the land-use table and the signature boxes
+GC_CHAR_H_MM, GC_COL_W_MM = 2.0, INFO_W
+MTEXT_ATTRS = {"layer":"TEXT", "char_height":GC_CHAR_H_MM * 0.001, "width":GC_COL_W_MM * 0.001}
+
+# outward unit normal of each site edge, used to place road bands and labels
+ROAD_NORMALS = {"north": (0, 1), "south": (0, -1), "east": (1, 0), "west": (-1, 0)}
+
+# ---------------- Static sheet text (joined once at import; MTEXT wraps to its box width) ----------------
+# the single-line TEXT fallback is pre-wrapped instead; Helvetica averages ~0.6 cap heights per character,
+# so wrapping at 0.65 keeps the widest lines inside the column
+GENERAL_CONDITIONS = [
+    "1. The single plot layout plan is approved based on the survey sketch certified by the Assistant Director of Land Records.",
+    "2. Building construction shall be undertaken only after obtaining approval for the building plan from the city corporation as per the approved single site layout plan.",
+    "3. The existing width of road abutting the site in question is marked in the plan. At the time of building plan approval the authority approving the building plan shall allow the maximum FAR permissible considering the minimum width of the road at any stretch towards any one side which shall join a road of equal or higher width.",
+    "4. The owner shall provide drinking water, waste water discharge system and drainage system for the site in question. During the building plan approval the owner shall submit a design to implement the rain water harvesting to collect the rain water from the entire site area.",
+    "5. Approval of single site layout plan shall not be a document to claim title to the property. In case of pending cases under the Land Reforms Act/Section 136(3) of the Land Revenue Act, 1964, approval of single site layout plan shall be subject to final order. The applicant shall be bound by the final order of the court in this regard and in no case the fees paid for the approval of the single site layout plan will be refunded.",
+    "6. If it is found that the land proposed by the applicant includes any land belonging to the Government or any other private land, in such a case, the Authority reserves the rights to modify the single site layout plan or to withdraw the plan.",
+    "7. If it is proved that the applicant has provided any false documents or forged documents for the plan sanction, the plan sanction shall stand canceled automatically.",
+    "8. The applicant shall be bound to all subsequent orders and the decision relating to payment of fees as required by the Authority.",
+    "9. Adequate provisions shall be made to segregate wet waste, dry waste and plastics. Area should be reserved for composting of wet waste, dry waste etc.",
+    "10. No Objection Certificates/Approvals for the building plan should be obtained from the competent authorities prior to construction of building on the approved single site.",
+    "11. Sewage shall not be discharged into open spaces/vacant areas but should be reused for gardening, cleaning of common areas and various other uses.",
+    "12. If the owner wishes to modify the single site layout approval to multi-plot residential layout, the owner shall submit a request to the Greater Bengaluru Authority and obtain approval for the multi-plot residential layout plan as per the zoning regulations.",
+    "13. One tree for every 240.0 sq.m of the total floor area shall be planted and nurtured at the site in question.",
+    "14. Prior permission should be obtained from the competent authority before constructing a culvert on the storm water drain between the land in question and the existing road attached to it if any.",
+    "15. To abide by such other conditions as may be imposed by the Authority from time to time."
+]
+WRAPPED_GC = "\n".join(GENERAL_CONDITIONS)
+
+NOTES = [
+    "1. The single plot plan is issued under the provisions of section 17 of KTCP Act 1961.",
+    "2. The applicant has remitted fees of Rs.******* vide challan No. ********* Dated : **.**.****.",
+    "3. The applicant has to abide by the conditions imposed in the single plot plan approval order.",
+    "4. This single plot plan is issued vide number ***/***/***-******* dated : **.**.****."
+]
+WRAPPED_NOTES = "\n".join(NOTES)
+GC_WRAP_CHARS = int(GC_COL_W_MM / (GC_CHAR_H_MM * 0.65))
+GC_FALLBACK_LINES = [l for c in GENERAL_CONDITIONS for l in textwrap.wrap(c, GC_WRAP_CHARS)]
+NOTES_FALLBACK_LINES = [l for n in NOTES for l in textwrap.wrap(n, GC_WRAP_CHARS)]
+
+# ---------------- Map PNGs referenced by the DXF (content-addressed, reused across runs) ----------------
+@st.cache_resource
+def _map_png_registry():
+    # one set per process; the files are removed when the process exits
+    paths = set()
+    def _cleanup():
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    atexit.register(_cleanup)
+    return paths
+
+def save_map_png(img):
+    # identical maps (same location/zoom/size) hash to the same file, so the PNG is encoded once
+    digest = hashlib.blake2b(img.tobytes(), digest_size=8).hexdigest()
+    path = os.path.join(tempfile.gettempdir(), f"ssp_{digest}.png")
+    if not os.path.exists(path):
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        img.save(tmp, "PNG", compress_level=1, optimize=False)
+        os.replace(tmp, path)  # atomic: concurrent sessions never see a partial file
+    _map_png_registry().add(path)
+    return path
+
+
+# ---------------- Helper: framed map image with its buffer overlay ----------------
+def insert_map(msp, doc, x_mm, y_mm, w_mm, h_mm, map_future, images, placeholder):
+    # draw the box, then embed the (image, center_px, radius_px) result of a make_keyplan_image future
+    # 1 mm inside it; images collects path -> PIL image for the PDF render.
+    # Falls back to placeholder text (and a warning) if the map could not be built or saved;
+    # returns True if the image went in.
+    msp.add_lwpolyline(rect_m(x_mm, y_mm, w_mm, h_mm), format="xy", dxfattribs=BORDER_ATTRS)
+    x_m, y_m = x_mm * M_PER_MM, y_mm * M_PER_MM
+    try:
+        img, center_px, radius_px = map_future.result()
+        png = save_map_png(img)
+    except (requests.RequestException, OSError, ValueError) as e:
+        st.warning(f"⚠️ {placeholder}: {e}")
+        safe_add_text(msp, placeholder, 0.009, (x_m + 0.05, y_m + 0.05))
+        return False
+    images[png] = img
+    image_def = doc.add_image_def(png, size_in_pixel=img.size)
+    insert, size = (x_m + 0.001, y_m + 0.001), ((w_mm - 2) * M_PER_MM, (h_mm - 2) * M_PER_MM)
+    msp.add_image(image_def, insert=insert, size_in_units=size)
+    add_buffer_overlay(msp, center_px, radius_px, img.size, insert, size)
+    return True
+
+
+# ---------------- PDF render (ReportLab, drawn straight from the DXF entities) ----------------
+PT_PER_MM = 72 / 25.4
+PT_PER_M = 1000 * PT_PER_MM   # DXF units are metres on an A3 sheet laid out in mm
+FONT = "Helvetica"
+CAP_HEIGHT = 0.72      # Helvetica cap height / em: DXF text height is cap height
+PDF_DASH = (6, 3)      # any non-continuous linetype (only GBA_DASH is used)
+PDF_DPI = 150          # raster budget for embedded maps: sharp on screen and in A3 prints
+
+def px_for_mm(w_mm, h_mm, dpi=PDF_DPI):
+    # pixel size an image needs to fill a w x h mm box at dpi
+    return int(w_mm / 25.4 * dpi), int(h_mm / 25.4 * dpi)
+
+def _pdf_style(layers, e):
+    # (rgb, line width pt, dashed) with BYLAYER resolved; colour 7 is black on paper
+    layer_aci, layer_ltype = layers[e.dxf.layer]
+    aci = e.dxf.color
+    if aci == 256:
+        aci = layer_aci
+    if aci in (0, 7):
+        rgb = (0, 0, 0)
+    else:
+        r, g, b = aci2rgb(aci)
+        rgb = (r/255.0, g/255.0, b/255.0)
+    lw = e.dxf.lineweight
+    ltype = e.dxf.linetype
+    if ltype == "BYLAYER":
+        ltype = layer_ltype
+    return rgb, (lw / 100.0 * PT_PER_MM if lw > 0 else 0.5), ltype.upper() != "CONTINUOUS"
+
+def render_pdf(doc, images=None):
+    """
+    Render the modelspace onto an A3 page at true scale; returns PDF bytes.
+    images maps IMAGEDEF filenames to in-memory PIL images (skips re-reading the PNGs).
+    """
+    # imported here so form reruns (which never render) don't pay the ReportLab import
+    from reportlab.lib.utils import ImageReader, simpleSplit
+    from reportlab.pdfgen import canvas
+
+    images = images or {}
+    buf = io.BytesIO()
+    c = canvas.Canvas(buf, pagesize=(PAGE_W_MM*PT_PER_MM, PAGE_H_MM*PT_PER_MM))
+    # layer table resolved once; pen state is only re-emitted when it changes
+    layers = {layer.dxf.name: (layer.color, layer.dxf.linetype) for layer in doc.layers}
+    pen = None
+    for e in doc.modelspace().entities_in_redraw_order():
+        kind = e.dxftype()
+        style = _pdf_style(layers, e)
+        if style != pen:
+            rgb, width, dashed = pen = style
+            c.setStrokeColorRGB(*rgb)
+            c.setFillColorRGB(*rgb)
+            c.setLineWidth(width)
+            if dashed:
+                c.setDash(*PDF_DASH)
+            else:
+                c.setDash()
+
+        if kind == "LWPOLYLINE":
+            pts = e.get_points("xy")
+            path = c.beginPath()
+            path.moveTo(pts[0][0]*PT_PER_M, pts[0][1]*PT_PER_M)
+            for x, y in pts[1:]:
+                path.lineTo(x*PT_PER_M, y*PT_PER_M)
+            if e.closed:
+                path.close()
+            c.drawPath(path, stroke=1, fill=0)
+        elif kind == "LINE":
+            s0, s1 = e.dxf.start, e.dxf.end
+            c.line(s0.x*PT_PER_M, s0.y*PT_PER_M, s1.x*PT_PER_M, s1.y*PT_PER_M)
+        elif kind == "CIRCLE":
+            ctr = e.dxf.center
+            c.circle(ctr.x*PT_PER_M, ctr.y*PT_PER_M, e.dxf.radius*PT_PER_M, stroke=1, fill=0)
+        elif kind == "ELLIPSE":
+            # only axis-aligned ellipses (full or clipped arcs) are drawn by this app
+            ctr, major = e.dxf.center, e.dxf.major_axis
+            a = major.magnitude
+            b = a * e.dxf.ratio
+            horizontal = abs(major.x) >= abs(major.y)
+            rx, ry = (a, b) if horizontal else (b, a)
+            box = ((ctr.x-rx)*PT_PER_M, (ctr.y-ry)*PT_PER_M, (ctr.x+rx)*PT_PER_M, (ctr.y+ry)*PT_PER_M)
+            extent = (e.dxf.end_param - e.dxf.start_param) % (2*math.pi)
+            if extent < 1e-9:
+                c.ellipse(*box, stroke=1, fill=0)
+            else:
+                start = e.dxf.start_param + (0.0 if horizontal else math.pi / 2)
+                c.arc(*box, startAng=math.degrees(start), extent=math.degrees(extent))
+        elif kind == "IMAGE":
+            ins = e.dxf.insert
+            w = e.dxf.u_pixel.magnitude * e.dxf.image_size.x
+            h = e.dxf.v_pixel.magnitude * e.dxf.image_size.y
+            fname = e.image_def.dxf.filename
+            src = ImageReader(images[fname]) if fname in images else fname
+            c.drawImage(src, ins.x*PT_PER_M, ins.y*PT_PER_M, w*PT_PER_M, h*PT_PER_M)
+        elif kind == "TEXT":
+            h = e.dxf.height
+            c.setFont(FONT, h*PT_PER_M / CAP_HEIGHT)
+            align, p1, p2 = e.get_placement()
+            name = align.name
+            p = p2 if (p2 is not None and name != "LEFT") else p1
+            x, y = p.x*PT_PER_M, p.y*PT_PER_M
+            if name.startswith("MIDDLE"):
+                y -= h*PT_PER_M / 2.0
+            if name.endswith("CENTER"):
+                c.drawCentredString(x, y, e.dxf.text)
+            elif name.endswith("RIGHT"):
+                c.drawRightString(x, y, e.dxf.text)
+            else:
+                c.drawString(x, y, e.dxf.text)
+        elif kind == "MTEXT":
+            # top-left attachment, wrapped to the MTEXT width, default 5/3 line spacing
+            h = e.dxf.char_height
+            size = h*PT_PER_M / CAP_HEIGHT
+            c.setFont(FONT, size)
+            x, y = e.dxf.insert.x*PT_PER_M, (e.dxf.insert.y - h)*PT_PER_M
+            width = e.dxf.width*PT_PER_M
+            for para in e.plain_text().split("\n"):
+                for line in (simpleSplit(para, FONT, size, width) if para else [""]):
+                    c.drawString(x, y, line)
+                    y -= h*PT_PER_M * 5.0/3.0
+    c.showPage()
+    c.save()
+    return buf.getvalue()
+
+
+# ---------------- PDF renders run here, off the script thread ----------------
+@st.cache_resource
+def _pdf_pool():
+    # process-wide, so a render keeps going while its session reruns
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf")
+
+
+# ---------------- Plan generation (DXF document) ----------------
+def build_sheet(survey_no, village, taluk, epid, ward_no, constituency, total_builtup,
+                site_length_m, site_width_m, road_info, lat, lon,
+                kp_zoom, kp_radius_m, adlr_zoom, adlr_buffer_m):
+    """
+    Build the DXF document; returns (doc, map_images) where map_images maps the embedded
+    PNG paths to their PIL images for render_pdf.
+    """
+    # key plan and ADLR sketch (zoomed inset) side by side at the top of the right column,
+    # leaving the height below for the conditions text
+    key_w_mm = adlr_w_mm = (INFO_W - 4) / 2.0
+    key_h_mm = adlr_h_mm = 45.0
+    key_x_mm, key_y_mm = INFO_X, PAGE_H_MM - TOP - key_h_mm
+    adlr_x_mm, adlr_y_mm = INFO_X + key_w_mm + 4, key_y_mm
+
+    # fetch key plan and ADLR maps concurrently (all 18 tiles share one executor) while the rest of
+    # the sheet is drawn; insert_map waits on each, and the pools close once the sheet is done
+    key_px = px_for_mm(key_w_mm, key_h_mm)
+    adlr_px = px_for_mm(adlr_w_mm, adlr_h_mm)
+    with ThreadPoolExecutor(max_workers=TILE_WORKERS) as tile_pool, ThreadPoolExecutor(max_workers=2) as map_pool:
+        kimg_future = map_pool.submit(make_keyplan_image, lat, lon, zoom=kp_zoom, radius_m=kp_radius_m, tiles_radius=1, scale=2, target_size=key_px, tile_pool=tile_pool)
+        adlr_future = map_pool.submit(make_keyplan_image, lat, lon, zoom=adlr_zoom, radius_m=adlr_buffer_m, tiles_radius=1, scale=2, target_size=adlr_px, tile_pool=tile_pool)
+
+        # Create DXF (units = metres)
+        doc = ezdxf.new(dxfversion="R2013")
+        msp = doc.modelspace()
+
+        # set layers
+        for lname, color in [("BORDER",7),("SITE",3),("ROAD",8),("TEXT",1),("IMAGES",5)]:
+            if not doc.layers.has_entry(lname):
+                doc.layers.add(lname, color=color)
+
+        # add dashed linetype
+        if not doc.linetypes.has_entry("GBA_DASH"):
+            doc.linetypes.add("GBA_DASH", pattern=[0.16, -0.05, 0.04, -0.05, 0.04, -0.05])
+
+        # --- drawing area / page border (in mm, convert later to metres) ---
+        # We'll compute positions in mm to match A3 layout, then convert to metres for DXF
+        inner_pad_mm = 8.0
+        usable_w_mm = DRAW_W - 2*inner_pad_mm
+        usable_h_mm = DRAW_H - 2*inner_pad_mm
+        mm_per_m_default = 1000.0/100.0  # for 1:100 -> 10 mm per metre scaled as 1000/100 = 10? (we keep consistent)
+        if (site_width_m * mm_per_m_default <= usable_w_mm) and (site_length_m * mm_per_m_default <= usable_h_mm):
+            mm_per_m_use = mm_per_m_default
+        else:
+            mm_per_m_use = min(usable_w_mm / site_width_m, usable_h_mm / site_length_m)
+
+        # site size in mm on sheet
+        site_w_mm_draw = site_width_m * mm_per_m_use
+        site_h_mm_draw = site_length_m * mm_per_m_use
+        site_x_mm = DRAW_X + inner_pad_mm + (usable_w_mm - site_w_mm_draw)/2.0
+        site_y_mm = DRAW_Y + inner_pad_mm + (usable_h_mm - site_h_mm_draw)/2.0
+
+        # convert mm to metres (DXF units)
+        site_x_m, site_y_m = site_x_mm * M_PER_MM, site_y_mm * M_PER_MM
+        site_w_m_draw, site_h_m_draw = site_w_mm_draw * M_PER_MM, site_h_mm_draw * M_PER_MM
+
+        # --- Page border (DXF in metres) ---
+        border_poly = rect_m(LEFT, BOTTOM, PAGE_W_MM - 2*LEFT, PAGE_H_MM - 2*BOTTOM)
+        msp.add_lwpolyline(border_poly, format="xy", dxfattribs=BORDER_ATTRS)
+
+        # --- Drawing rectangle (left area) ---
+        draw_rect = rect_m(DRAW_X, DRAW_Y, DRAW_W, DRAW_H)
+        msp.add_lwpolyline(draw_rect, format="xy", dxfattribs=BORDER_ATTRS)
+
+        # --- Draw site rectangle with dashed linetype ---
+        msp.add_lwpolyline(rect_m(site_x_mm, site_y_mm, site_w_mm_draw, site_h_mm_draw), format="xy", dxfattribs=SITE_ATTRS)
+
+        # --- Draw roads around site (converted from mm -> m) ---
+        site_cx_mm, site_cy_mm = site_x_mm + site_w_mm_draw/2.0, site_y_mm + site_h_mm_draw/2.0
+        for side, info in road_info.items():
+            if not info["exists"]:
+                continue
+            w_m = info["width"]
+            road_band_mm = w_m * mm_per_m_use
+            # road band = site edge extruded outward along the side's normal
+            nx, ny = ROAD_NORMALS[side]
+            band_cx = site_cx_mm + nx*(site_w_mm_draw + road_band_mm)/2.0
+            band_cy = site_cy_mm + ny*(site_h_mm_draw + road_band_mm)/2.0
+            band_w = road_band_mm if nx else site_w_mm_draw
+            band_h = road_band_mm if ny else site_h_mm_draw
+            msp.add_lwpolyline(rect_m(band_cx - band_w/2.0, band_cy - band_h/2.0, band_w, band_h), format="xy", dxfattribs=ROAD_ATTRS)
+            # add road label 3 mm beyond the band centre
+            tx_m, ty_m = (band_cx + nx*3) * M_PER_MM, (band_cy + ny*3) * M_PER_MM
+            add_centered_text(msp, f"{side.title()} ({w_m:.1f} m ROAD)", tx_m, ty_m, TEXT_ATTRS_H9)
+
+        # --- Site title (centered above site) ---
+        safe_add_text(msp, f"SITE (SY.NO. {survey_no})", 0.010, (site_x_m + site_w_m_draw/2.0, site_y_m + site_h_m_draw + 0.018), align="MIDDLE_CENTER")
+
+        # ---------------- Right column: Key Plan, ADLR, Land Use, General Conditions, Note ----------------
+        # Land Use Analysis table below the maps
+        lut_x_mm = INFO_X
+        tbl_w_mm = 12 + 55 + 30 + 20
+        header_y_mm = key_y_mm - 6
+        # column centres (m), shared by the header and every row
+        col_w = [12,55,30,20]
+        col_cx_m = [(lut_x_mm + sum(col_w[:i]) + col_w[i]/2.0) * M_PER_MM for i in range(len(col_w))]
+        # headers
+        headers = ["SL.No","PARTICULARS","AREA (Sq.m)","%"]
+        header_y_m = header_y_mm * M_PER_MM
+        for cx_m, h in zip(col_cx_m, headers):
+            add_centered_text(msp, h, cx_m, header_y_m, TEXT_ATTRS_H9)
+        # rows
+        rows = [
+            ("1","SITE AREA", f"{site_width_m * site_length_m:.1f}", "100.00"),
+            ("2","TOTAL SITE AREA", f"{site_width_m * site_length_m:.1f}", "100.00"),
+        ]
+        row_h_mm = 6.5
+        for r_idx, row in enumerate(rows):
+            y_m = (header_y_mm - (r_idx + 1) * row_h_mm) * M_PER_MM
+            for cx_m, val in zip(col_cx_m, row):
+                add_centered_text(msp, val, cx_m, y_m, TEXT_ATTRS_H7)
+        # table border
+        tbl_h_mm = (len(rows)+1.2)*row_h_mm
+        msp.add_lwpolyline(rect_m(lut_x_mm - 1.5, header_y_mm + 2 - tbl_h_mm, tbl_w_mm + 3, tbl_h_mm), format="xy", dxfattribs=BORDER_LINE_ATTRS)
+
+        # General Conditions (15) placed under table
+        gc_x_m = INFO_X * M_PER_MM
+        gc_start_y_mm = header_y_mm + 2 - tbl_h_mm - 3
+        gc_start_y_m = gc_start_y_mm * M_PER_MM
+        gc_h_m = GC_CHAR_H_MM * M_PER_MM
+        gc_step_m = gc_h_m * 5.0/3.0
+        # write as MTEXT
+        try:
+            msp.add_mtext(WRAPPED_GC, dxfattribs=MTEXT_ATTRS).set_location((gc_x_m, gc_start_y_m))
+        except Exception:
+            # fallback to pre-wrapped single-line texts if MTEXT fails (same line spacing as MTEXT)
+            y = gc_start_y_m
+            for line in GC_FALLBACK_LINES:
+                safe_add_text(msp, line, gc_h_m, (gc_x_m, y - gc_h_m))
+                y -= gc_step_m
+
+        # Note block right below the general conditions (one blank line apart)
+        note_y_m = gc_start_y_m - (len(GC_FALLBACK_LINES) + 1) * gc_step_m
+        try:
+            msp.add_mtext(WRAPPED_NOTES, dxfattribs=MTEXT_ATTRS).set_location((gc_x_m, note_y_m))
+        except Exception:
+            y = note_y_m
+            for line in NOTES_FALLBACK_LINES:
+                safe_add_text(msp, line, gc_h_m, (gc_x_m, y - gc_h_m))
+                y -= gc_step_m
+
+        # ---------------- Title block (bottom) with empty signature boxes ----------------
+        tb_x_mm, tb_y_mm, tb_w_mm, tb_h_mm = LEFT, BOTTOM, PAGE_W_MM - LEFT - RIGHT, 35.0
+        tb_x_m, tb_y_m, tb_h_m = tb_x_mm * M_PER_MM, tb_y_mm * M_PER_MM, tb_h_mm * M_PER_MM
+        # title block outer rectangle
+        msp.add_lwpolyline(rect_m(tb_x_mm, tb_y_mm, tb_w_mm, tb_h_mm), format="xy", dxfattribs=BORDER_ATTRS)
+        # vertical dividers
+        dv1_m = (tb_x_mm + tb_w_mm*0.48) * M_PER_MM
+        dv2_m = (tb_x_mm + tb_w_mm*0.70) * M_PER_MM
+        msp.add_line((dv1_m, tb_y_m), (dv1_m, tb_y_m + tb_h_m), dxfattribs=BORDER_LINE_ATTRS)
+        msp.add_line((dv2_m, tb_y_m), (dv2_m, tb_y_m + tb_h_m), dxfattribs=BORDER_LINE_ATTRS)
+
+        # title block texts (English only for output)
+        col0_m, col1_m, col2_m = tb_x_m + 0.006, dv1_m + 0.006, dv2_m + 0.006
+        y1_m, y2_m, y3_m, y4_m = [tb_y_m + (tb_h_mm - o) * M_PER_MM for o in (7, 13, 19, 25)]
+        # fixed labels at computed positions go through add_text_fast; user-entered text keeps safe_add_text
+        add_text_fast(msp, "DRAWING TITLE : SINGLE SITE LAYOUT PLAN", col0_m, y1_m, TEXT_ATTRS_H9)
+        add_text_fast(msp, f"SCALE : 1:{int(100)}", col0_m, y2_m, TEXT_ATTRS_H7)
+        add_text_fast(msp, f"TOTAL BUILT-UP AREA : {total_builtup:.2f} Sq.m", col0_m, y3_m, TEXT_ATTRS_H7)
+        safe_add_text(msp, f"SY. NO. : {survey_no}", 0.007, (col0_m, y4_m), align="LEFT")
+
+        safe_add_text(msp, f"VILLAGE : {village}", 0.007, (col1_m, y1_m), align="LEFT")
+        safe_add_text(msp, f"TALUK : {taluk}", 0.007, (col1_m, y2_m), align="LEFT")
+        safe_add_text(msp, f"EPID : {epid}", 0.007, (col1_m, y3_m), align="LEFT")
+        add_text_fast(msp, f"ROAD NAME : {''}", col1_m, y4_m, TEXT_ATTRS_H7)  # kept blank for user input saved elsewhere
+
+        add_text_fast(msp, f"ROAD WIDTH : {''}", col2_m, y1_m, TEXT_ATTRS_H7)
+        add_text_fast(msp, f"ROAD FACING : {''}", col2_m, y2_m, TEXT_ATTRS_H7)
+        add_text_fast(msp, f"SITE DIMENSIONS : {site_length_m:.2f} m x {site_width_m:.2f} m", col2_m, y3_m, TEXT_ATTRS_H7)
+        safe_add_text(msp, f"WARD NO. : {ward_no}    CONSTITUENCY : {constituency}", 0.007, (col2_m, y4_m), align="LEFT")
+
+        add_text_fast(msp, "All Dimensions in metres.", (PAGE_W_MM - RIGHT - 4) * M_PER_MM, tb_y_m + 0.003, TEXT_ATTRS_H6, align="RIGHT")
+
+        # --- Empty signature boxes (a row of 4 above the title block, across the right column) ---
+        sig_box_w_mm, sig_box_h_mm = (INFO_W - 3*2.0) / 4, 12.0
+        sig_start_x_mm = INFO_X
+        sig_start_y_mm = tb_y_mm + tb_h_mm + 3.0
+        for i in range(4):
+            sx_mm = sig_start_x_mm + i*(sig_box_w_mm + 2.0)
+            sy_mm = sig_start_y_mm
+            msp.add_lwpolyline(rect_m(sx_mm, sy_mm, sig_box_w_mm, sig_box_h_mm), format="xy",
+                               dxfattribs=BORDER_ATTRS)
+
+        # insert map images last, so tile I/O overlaps everything above (if OSM works);
+        # map_images lets the PDF render use the PIL images directly
+        map_images = {}
+        if insert_map(msp, doc, key_x_mm, key_y_mm, key_w_mm, key_h_mm, kimg_future, map_images, "KEY PLAN (To be inserted)"):
+            # north arrow
+            na_x_m = (key_x_mm + key_w_mm - 8) * M_PER_MM
+            na_y_m = (key_y_mm + key_h_mm - 18) * M_PER_MM
+            msp.add_line((na_x_m, na_y_m), (na_x_m, na_y_m + 0.012), dxfattribs=BORDER_LINE_ATTRS)
+            add_centered_text(msp, "N", na_x_m, na_y_m + 0.014, TEXT_ATTRS_H6)
+        insert_map(msp, doc, adlr_x_mm, adlr_y_mm, adlr_w_mm, adlr_h_mm, adlr_future, map_images, "ADLR SKETCH (To be inserted)")
+        # added last but drawn first: sort handle "1" puts the images under the vectors around them
+        msp.set_redraw_order((e.dxf.handle, "1") for e in msp.query("IMAGE"))
+
+        return doc, map_images
+
+
+def write_dxf(doc, binary=False):
+    """
+    DXF bytes written straight to memory; binary=True writes Binary DXF (smaller, faster),
+    falling back to ASCII DXF if that fails.
+    """
+    if binary:
+        try:
+            buf = io.BytesIO()
+            doc.write(buf, fmt="bin")
+            return buf.getvalue()
+        except Exception:
+            pass  # fall back to ASCII DXF below
+    buf = io.StringIO()
+    doc.write(buf)
+    return doc.encode(buf.getvalue())
+
 
 # ---------------- Streamlit UI ----------------
 st.set_page_config(page_title="Single Site Plan — DXF + PDF", layout="centered")
@@ -136,22 +813,26 @@ kp_zoom = st.slider("Key plan zoom (10-19)\nನಕ್ಷೆ ಝೂಮ್", min_v
 # parse input -> geocode or parse lat,lon
 picked_latlon = None
 if kp_center_txt.strip():
-    if "," in kp_center_txt:
-        try:
-            a,b = kp_center_txt.split(",",1)
-            picked_latlon = (float(a.strip()), float(b.strip()))
+    m = LATLON_RE.match(kp_center_txt)
+    if m:
+        lat_in, lon_in = float(m.group(1)), float(m.group(2))
+        # web-mercator tiles stop at +-85.05 deg; a swapped pair like "120, 12" would break the tile maths
+        if abs(lat_in) <= 85.05 and abs(lon_in) <= 180:
+            picked_latlon = (lat_in, lon_in)
             st.success(f"Using coordinates: {picked_latlon[0]:.6f}, {picked_latlon[1]:.6f}")
-        except Exception:
-            picked_latlon = None
+        else:
+            st.warning("⚠️ Coordinates out of range (lat within ±85.05, lon within ±180), using the default location.")
     else:
+        # not a lat,lon pair: treat as an address (comma-separated addresses included)
         try:
-            r = requests.get("https://nominatim.openstreetmap.org/search", params={"q":kp_center_txt,"format":"json","limit":1}, headers={"User-Agent":"SingleSitePlan/1.0"}, timeout=8)
-            data = r.json()
-            if data:
-                picked_latlon = (float(data[0]["lat"]), float(data[0]["lon"]))
+            picked_latlon = geocode(kp_center_txt.strip())
+        except (requests.RequestException, ValueError, KeyError) as e:
+            st.warning(f"⚠️ Geocoding failed, using the default location: {e}")
+        else:
+            if picked_latlon:
                 st.success(f"Geocoded: {picked_latlon[0]:.6f}, {picked_latlon[1]:.6f}")
-        except Exception:
-            picked_latlon = None
+            else:
+                st.warning("⚠️ Address not found, using the default location.")
 
 if not picked_latlon:
     # default Bangalore
@@ -162,336 +843,60 @@ adlr_zoom = min(19, kp_zoom + 3)
 adlr_buffer_m = 50
 
 # ---------------- Generate output ----------------
-if st.button("Generate DXF + PDF"):
-    # Page layout constants (mm)
-    PAGE_W_MM, PAGE_H_MM = 420.0, 297.0
-    LEFT, RIGHT, TOP, BOTTOM = 12.0, 12.0, 12.0, 12.0
-    INFO_GAP = 15.0
-    DRAW_W = PAGE_W_MM * 0.62
-    DRAW_H = PAGE_H_MM - TOP - BOTTOM
-    DRAW_X = LEFT
-    DRAW_Y = BOTTOM
-    INFO_X = DRAW_X + DRAW_W + INFO_GAP
-
-    # Create DXF (units = metres)
-    doc = ezdxf.new(dxfversion="R2013")
-    msp = doc.modelspace()
-
-    # set layers
-    for lname, color in [("BORDER",7),("SITE",3),("ROAD",8),("TEXT",1),("IMAGES",5)]:
-        if lname not in doc.layers:
-            doc.layers.add(lname, color=color)
-
-    # add dashed linetype
-    if "GBA_DASH" not in doc.linetypes:
-        doc.linetypes.add("GBA_DASH", pattern=[0.16, -0.05, 0.04, -0.05, 0.04, -0.05])
-
-    # --- drawing area / page border (in mm, convert later to metres) ---
-    # We'll compute positions in mm to match A3 layout, then convert to metres for DXF
-    inner_pad_mm = 8.0
-    usable_w_mm = DRAW_W - 2*inner_pad_mm
-    usable_h_mm = DRAW_H - 2*inner_pad_mm
-    mm_per_m_default = 1000.0/100.0  # for 1:100 -> 10 mm per metre scaled as 1000/100 = 10? (we keep consistent)
-    if (site_width_m * mm_per_m_default <= usable_w_mm) and (site_length_m * mm_per_m_default <= usable_h_mm):
-        mm_per_m_use = mm_per_m_default
-    else:
-        mm_per_m_use = min(usable_w_mm / site_width_m, usable_h_mm / site_length_m)
-
-    # site size in mm on sheet
-    site_w_mm_draw = site_width_m * mm_per_m_use
-    site_h_mm_draw = site_length_m * mm_per_m_use
-    site_x_mm = DRAW_X + inner_pad_mm + (usable_w_mm - site_w_mm_draw)/2.0
-    site_y_mm = DRAW_Y + inner_pad_mm + (usable_h_mm - site_h_mm_draw)/2.0
-
-    # convert mm to metres (DXF units)
-    site_x_m = site_x_mm / 1000.0
-    site_y_m = site_y_mm / 1000.0
-    site_w_m_draw = site_w_mm_draw / 1000.0
-    site_h_m_draw = site_h_mm_draw / 1000.0
-
-    # --- Page border (DXF in metres) ---
-    border_poly = [
-        (LEFT/1000.0, BOTTOM/1000.0),
-        ((PAGE_W_MM-LEFT)/1000.0, BOTTOM/1000.0),
-        ((PAGE_W_MM-LEFT)/1000.0, (PAGE_H_MM-BOTTOM)/1000.0),
-        (LEFT/1000.0, (PAGE_H_MM-BOTTOM)/1000.0),
-        (LEFT/1000.0, BOTTOM/1000.0)
-    ]
-    msp.add_lwpolyline(border_poly, dxfattribs={"layer":"BORDER", "closed":True})
-
-    # --- Drawing rectangle (left area) ---
-    draw_rect = [
-        (DRAW_X/1000.0, DRAW_Y/1000.0),
-        ((DRAW_X + DRAW_W)/1000.0, DRAW_Y/1000.0),
-        ((DRAW_X + DRAW_W)/1000.0, (DRAW_Y + DRAW_H)/1000.0),
-        (DRAW_X/1000.0, (DRAW_Y + DRAW_H)/1000.0),
-        (DRAW_X/1000.0, DRAW_Y/1000.0)
-    ]
-    msp.add_lwpolyline(draw_rect, dxfattribs={"layer":"BORDER", "closed":True})
-
-    # --- Draw site rectangle with dashed linetype ---
-    msp.add_lwpolyline([
-        (site_x_m, site_y_m),
-        (site_x_m + site_w_m_draw, site_y_m),
-        (site_x_m + site_w_m_draw, site_y_m + site_h_m_draw),
-        (site_x_m, site_y_m + site_h_m_draw),
-        (site_x_m, site_y_m)
-    ], dxfattribs={"layer":"SITE", "linetype":"GBA_DASH", "closed":True})
-
-    # --- Draw roads around site (converted from mm -> m) ---
-    for side, info in road_info.items():
-        if not info["exists"]:
-            continue
-        w_m = info["width"]
-        road_band_mm = w_m * mm_per_m_use
-        if side == "north":
-            poly_mm = [(site_x_mm, site_y_mm + site_h_mm_draw),
-                       (site_x_mm + site_w_mm_draw, site_y_mm + site_h_mm_draw),
-                       (site_x_mm + site_w_mm_draw, site_y_mm + site_h_mm_draw + road_band_mm),
-                       (site_x_mm, site_y_mm + site_h_mm_draw + road_band_mm),
-                       (site_x_mm, site_y_mm + site_h_mm_draw)]
-            label_mm = (site_x_mm + site_w_mm_draw/2.0, site_y_mm + site_h_mm_draw + road_band_mm/2.0 + 3)
-        elif side == "south":
-            poly_mm = [(site_x_mm, site_y_mm - road_band_mm),
-                       (site_x_mm + site_w_mm_draw, site_y_mm - road_band_mm),
-                       (site_x_mm + site_w_mm_draw, site_y_mm),
-                       (site_x_mm, site_y_mm),
-                       (site_x_mm, site_y_mm - road_band_mm)]
-            label_mm = (site_x_mm + site_w_mm_draw/2.0, site_y_mm - road_band_mm/2.0 - 3)
-        elif side == "east":
-            poly_mm = [(site_x_mm + site_w_mm_draw, site_y_mm),
-                       (site_x_mm + site_w_mm_draw + road_band_mm, site_y_mm),
-                       (site_x_mm + site_w_mm_draw + road_band_mm, site_y_mm + site_h_mm_draw),
-                       (site_x_mm + site_w_mm_draw, site_y_mm + site_h_mm_draw),
-                       (site_x_mm + site_w_mm_draw, site_y_mm)]
-            label_mm = (site_x_mm + site_w_mm_draw + road_band_mm/2.0 + 3, site_y_mm + site_h_mm_draw/2.0)
-        else:  # west
-            poly_mm = [(site_x_mm - road_band_mm, site_y_mm),
-                       (site_x_mm, site_y_mm),
-                       (site_x_mm, site_y_mm + site_h_mm_draw),
-                       (site_x_mm - road_band_mm, site_y_mm + site_h_mm_draw),
-                       (site_x_mm - road_band_mm, site_y_mm)]
-            label_mm = (site_x_mm - road_band_mm/2.0 - 3, site_y_mm + site_h_mm_draw/2.0)
-
-        poly_m = [(x/1000.0, y/1000.0) for x,y in poly_mm]
-        msp.add_lwpolyline(poly_m, dxfattribs={"layer":"ROAD", "closed":True})
-        # add road label with safe wrapper
-        tx_m, ty_m = label_mm[0]/1000.0, label_mm[1]/1000.0
-        safe_add_text(msp, f"{side.title()} ({w_m:.1f} m ROAD)", 0.009, (tx_m, ty_m), align="MIDDLE_CENTER")
-
-    # --- Site title (centered above site) ---
-    safe_add_text(msp, f"SITE (SY.NO. {survey_no})", 0.010, (site_x_m + site_w_m_draw/2.0, site_y_m + site_h_m_draw + 0.018), align="MIDDLE_CENTER")
-
-    # ---------------- Right column: Key Plan, ADLR, Land Use, General Conditions, Note ----------------
-    key_w_mm, key_h_mm = 110.0, 70.0
-    key_x_mm, key_y_mm = INFO_X, PAGE_H_MM - TOP - key_h_mm
-    key_x_m, key_y_m = key_x_mm/1000.0, key_y_mm/1000.0
-    # Draw key plan box
-    msp.add_lwpolyline([(key_x_m, key_y_m),
-                        ((key_x_mm + key_w_mm)/1000.0, key_y_m),
-                        ((key_x_mm + key_w_mm)/1000.0, (key_y_mm + key_h_mm)/1000.0),
-                        (key_x_m, (key_y_mm + key_h_mm)/1000.0),
-                        (key_x_m, key_y_m)], dxfattribs={"layer":"BORDER", "closed":True})
-
-    # insert keyplan image (if OSM works)
-    tmp_files = []
-    try:
-        kimg = make_keyplan_image(picked_latlon[0], picked_latlon[1], zoom=kp_zoom, radius_m=kp_radius_m, tiles_radius=1, scale=2)
-        px_w = int(key_w_mm * 6)
-        px_h = int(key_h_mm * 6)
-        kimg = kimg.resize((px_w, px_h), Image.LANCZOS)
-        tmp_key = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        kimg.convert("RGB").save(tmp_key.name)
-        tmp_files.append(tmp_key.name)
-        image_def = doc.add_image_def(tmp_key.name, size_in_px=(px_w, px_h))
-        msp.add_image(image_def, insert=(key_x_m + 0.001, key_y_m + 0.001), size_in_units=(key_w_mm/1000.0 - 0.002, key_h_mm/1000.0 - 0.002))
-        # north arrow
-        na_x_m = (key_x_mm + key_w_mm - 8)/1000.0
-        na_y_m = (key_y_mm + key_h_mm - 18)/1000.0
-        msp.add_line((na_x_m, na_y_m), (na_x_m, na_y_m + 0.012), dxfattribs={"layer":"BORDER"})
-        safe_add_text(msp, "N", 0.006, (na_x_m, na_y_m + 0.014), align="MIDDLE_CENTER")
-    except Exception:
-        safe_add_text(msp, "KEY PLAN (To be inserted)", 0.009, (key_x_m + 0.05, key_y_m + 0.05))
-
-    # ADLR sketch (below key plan, zoomed inset)
-    adlr_w_mm, adlr_h_mm = 110.0, 65.0
-    adlr_x_mm, adlr_y_mm = INFO_X, key_y_mm - adlr_h_mm - 10
-    adlr_x_m, adlr_y_m = adlr_x_mm/1000.0, adlr_y_mm/1000.0
-    msp.add_lwpolyline([(adlr_x_m, adlr_y_m),
-                        ((adlr_x_mm + adlr_w_mm)/1000.0, adlr_y_m),
-                        ((adlr_x_mm + adlr_w_mm)/1000.0, (adlr_y_mm + adlr_h_mm)/1000.0),
-                        (adlr_x_m, (adlr_y_mm + adlr_h_mm)/1000.0),
-                        (adlr_x_m, adlr_y_m)], dxfattribs={"layer":"BORDER", "closed":True})
-    try:
-        adlr_img = make_keyplan_image(picked_latlon[0], picked_latlon[1], zoom=adlr_zoom, radius_m=adlr_buffer_m, tiles_radius=1, scale=2)
-        px_w = int(adlr_w_mm * 6)
-        px_h = int(adlr_h_mm * 6)
-        adlr_img = adlr_img.resize((px_w, px_h), Image.LANCZOS)
-        tmp_adlr = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-        adlr_img.convert("RGB").save(tmp_adlr.name)
-        tmp_files.append(tmp_adlr.name)
-        adlr_def = doc.add_image_def(tmp_adlr.name, size_in_px=(px_w, px_h))
-        msp.add_image(adlr_def, insert=(adlr_x_m + 0.001, adlr_y_m + 0.001), size_in_units=(adlr_w_mm/1000.0 - 0.002, adlr_h_mm/1000.0 - 0.002))
-    except Exception:
-        safe_add_text(msp, "ADLR SKETCH (To be inserted)", 0.009, (adlr_x_m + 0.05, adlr_y_m + 0.05))
-
-    # Land Use Analysis table below ADLR
-    lut_x_mm, lut_y_mm = INFO_X, adlr_y_mm - 10
-    tbl_w_mm = 12 + 55 + 30 + 20
-    header_y_mm = lut_y_mm + 12
-    # headers
-    xcur_mm = lut_x_mm
-    col_w = [12,55,30,20]
-    headers = ["SL.No","PARTICULARS","AREA (Sq.m)","%"]
-    for i,h in enumerate(headers):
-        safe_add_text(msp, h, 0.009, ((xcur_mm + col_w[i]/2.0)/1000.0, header_y_mm/1000.0), align="MIDDLE_CENTER")
-        xcur_mm += col_w[i]
-    # rows
-    rows = [
-        ("1","SITE AREA", f"{site_width_m * site_length_m:.1f}", "100.00"),
-        ("2","TOTAL SITE AREA", f"{site_width_m * site_length_m:.1f}", "100.00"),
-    ]
-    row_h_mm = 6.5
-    for r_idx, row in enumerate(rows):
-        y_mm = header_y_mm - (r_idx + 1) * row_h_mm
-        xcur_mm = lut_x_mm
-        for i,val in enumerate(row):
-            safe_add_text(msp, str(val), 0.007, ((xcur_mm + col_w[i]/2.0)/1000.0, y_mm/1000.0), align="MIDDLE_CENTER")
-            xcur_mm += col_w[i]
-    # table border
-    msp.add_lwpolyline([(lut_x_mm - 1.5, header_y_mm + 2),
-                        (lut_x_mm - 1.5 + tbl_w_mm + 3, header_y_mm + 2),
-                        (lut_x_mm - 1.5 + tbl_w_mm + 3, header_y_mm + 2 - (len(rows)+1.2)*row_h_mm),
-                        (lut_x_mm - 1.5, header_y_mm + 2 - (len(rows)+1.2)*row_h_mm),
-                        (lut_x_mm - 1.5, header_y_mm + 2)], dxfattribs={"layer":"BORDER"})
-
-    # General Conditions (15) placed under table
-    gc_x_mm = INFO_X
-    gc_start_y_mm = header_y_mm - (len(rows)+1.2)*row_h_mm - 8
-    general_conditions = [
-        "1. The single plot layout plan is approved based on the survey sketch certified by the Assistant Director of Land Records.",
-        "2. Building construction shall be undertaken only after obtaining approval for the building plan from the city corporation as per the approved single site layout plan.",
-        "3. The existing width of road abutting the site in question is marked in the plan. At the time of building plan approval the authority approving the building plan shall allow the maximum FAR permissible considering the minimum width of the road at any stretch towards any one side which shall join a road of equal or higher width.",
-        "4. The owner shall provide drinking water, waste water discharge system and drainage system for the site in question. During the building plan approval the owner shall submit a design to implement the rain water harvesting to collect the rain water from the entire site area.",
-        "5. Approval of single site layout plan shall not be a document to claim title to the property. In case of pending cases under the Land Reforms Act/Section 136(3) of the Land Revenue Act, 1964, approval of single site layout plan shall be subject to final order. The applicant shall be bound by the final order of the court in this regard and in no case the fees paid for the approval of the single site layout plan will be refunded.",
-        "6. If it is found that the land proposed by the applicant includes any land belonging to the Government or any other private land, in such a case, the Authority reserves the rights to modify the single site layout plan or to withdraw the plan.",
-        "7. If it is proved that the applicant has provided any false documents or forged documents for the plan sanction, the plan sanction shall stand canceled automatically.",
-        "8. The applicant shall be bound to all subsequent orders and the decision relating to payment of fees as required by the Authority.",
-        "9. Adequate provisions shall be made to segregate wet waste, dry waste and plastics. Area should be reserved for composting of wet waste, dry waste etc.",
-        "10. No Objection Certificates/Approvals for the building plan should be obtained from the competent authorities prior to construction of building on the approved single site.",
-        "11. Sewage shall not be discharged into open spaces/vacant areas but should be reused for gardening, cleaning of common areas and various other uses.",
-        "12. If the owner wishes to modify the single site layout approval to multi-plot residential layout, the owner shall submit a request to the Greater Bengaluru Authority and obtain approval for the multi-plot residential layout plan as per the zoning regulations.",
-        "13. One tree for every 240.0 sq.m of the total floor area shall be planted and nurtured at the site in question.",
-        "14. Prior permission should be obtained from the competent authority before constructing a culvert on the storm water drain between the land in question and the existing road attached to it if any.",
-        "15. To abide by such other conditions as may be imposed by the Authority from time to time."
-    ]
-    wrapped_gc = "\n\n".join([textwrap.fill(l, width=80) for l in general_conditions])
-    # write as MTEXT
-    try:
-        msp.add_mtext(wrapped_gc, dxfattribs={"layer":"TEXT", "height":float(0.008), "width":0.11}).set_location((gc_x_mm/1000.0, gc_start_y_mm/1000.0))
-    except Exception:
-        # fallback to multiple small texts if MTEXT fails
-        y = gc_start_y_mm/1000.0
-        for line in general_conditions:
-            safe_add_text(msp, line, 0.008, (gc_x_mm/1000.0, y))
-            y -= 0.012
-
-    # Note block (below general conditions)
-    notes = [
-        "1. The single plot plan is issued under the provisions of section 17 of KTCP Act 1961.",
-        "2. The applicant has remitted fees of Rs.******* vide challan No. ********* Dated : **.**.****.",
-        "3. The applicant has to abide by the conditions imposed in the single plot plan approval order.",
-        "4. This single plot plan is issued vide number ***/***/***-******* dated : **.**.****."
-    ]
-    wrapped_note = "\n".join(notes)
-    note_y_mm = gc_start_y_mm - 85
-    try:
-        msp.add_mtext(wrapped_note, dxfattribs={"layer":"TEXT", "height":float(0.008), "width":0.11}).set_location((gc_x_mm/1000.0, note_y_mm/1000.0))
-    except Exception:
-        y = note_y_mm/1000.0
-        for line in notes:
-            safe_add_text(msp, line, 0.008, (gc_x_mm/1000.0, y))
-            y -= 0.010
-
-    # ---------------- Title block (bottom) with empty signature boxes ----------------
-    tb_x_mm, tb_y_mm, tb_w_mm, tb_h_mm = LEFT, BOTTOM, PAGE_W_MM - LEFT - RIGHT, 35.0
-    tb_x_m, tb_y_m = tb_x_mm/1000.0, tb_y_mm/1000.0
-    # title block outer rectangle
-    msp.add_lwpolyline([(tb_x_m, tb_y_m),
-                        ((tb_x_mm + tb_w_mm)/1000.0, tb_y_m),
-                        ((tb_x_mm + tb_w_mm)/1000.0, (tb_y_mm + tb_h_mm)/1000.0),
-                        (tb_x_m, (tb_y_mm + tb_h_mm)/1000.0),
-                        (tb_x_m, tb_y_m)], dxfattribs={"layer":"BORDER", "closed":True})
-    # vertical dividers
-    dv1_m = (tb_x_mm + tb_w_mm*0.48)/1000.0
-    dv2_m = (tb_x_mm + tb_w_mm*0.70)/1000.0
-    msp.add_line((dv1_m, tb_y_m), (dv1_m, tb_y_m + tb_h_mm/1000.0), dxfattribs={"layer":"BORDER"})
-    msp.add_line((dv2_m, tb_y_m), (dv2_m, tb_y_m + tb_h_mm/1000.0), dxfattribs={"layer":"BORDER"})
-
-    # title block texts (English only for output)
-    safe_add_text(msp, "DRAWING TITLE : SINGLE SITE LAYOUT PLAN", 0.009, (tb_x_m + 0.006, tb_y_m + (tb_h_mm - 7)/1000.0), align="LEFT")
-    safe_add_text(msp, f"SCALE : 1:{int(100)}", 0.007, (tb_x_m + 0.006, tb_y_m + (tb_h_mm - 13)/1000.0), align="LEFT")
-    safe_add_text(msp, f"TOTAL BUILT-UP AREA : {total_builtup:.2f} Sq.m", 0.007, (tb_x_m + 0.006, tb_y_m + (tb_h_mm - 19)/1000.0), align="LEFT")
-    safe_add_text(msp, f"SY. NO. : {survey_no}", 0.007, (tb_x_m + 0.006, tb_y_m + (tb_h_mm - 25)/1000.0), align="LEFT")
-
-    safe_add_text(msp, f"VILLAGE : {village}", 0.007, (dv1_m + 0.006, tb_y_m + (tb_h_mm - 7)/1000.0), align="LEFT")
-    safe_add_text(msp, f"TALUK : {taluk}", 0.007, (dv1_m + 0.006, tb_y_m + (tb_h_mm - 13)/1000.0), align="LEFT")
-    safe_add_text(msp, f"EPID : {epid}", 0.007, (dv1_m + 0.006, tb_y_m + (tb_h_mm - 19)/1000.0), align="LEFT")
-    safe_add_text(msp, f"ROAD NAME : {''}", 0.007, (dv1_m + 0.006, tb_y_m + (tb_h_mm - 25)/1000.0), align="LEFT")  # kept blank for user input saved elsewhere
-
-    safe_add_text(msp, f"ROAD WIDTH : {''}", 0.007, (dv2_m + 0.006, tb_y_m + (tb_h_mm - 7)/1000.0), align="LEFT")
-    safe_add_text(msp, f"ROAD FACING : {''}", 0.007, (dv2_m + 0.006, tb_y_m + (tb_h_mm - 13)/1000.0), align="LEFT")
-    safe_add_text(msp, f"SITE DIMENSIONS : {site_length_m:.2f} m x {site_width_m:.2f} m", 0.007, (dv2_m + 0.006, tb_y_m + (tb_h_mm - 19)/1000.0), align="LEFT")
-    safe_add_text(msp, f"WARD NO. : {ward_no}    CONSTITUENCY : {constituency}", 0.007, (dv2_m + 0.006, tb_y_m + (tb_h_mm - 25)/1000.0), align="LEFT")
-
-    safe_add_text(msp, "All Dimensions in metres.", 0.006, ((PAGE_W_MM - RIGHT - 4)/1000.0, tb_y_m + 0.003), align="RIGHT")
-
-    # --- Empty signature boxes (4 boxes above title block, right side) ---
-    sig_box_w_mm, sig_box_h_mm = 40.0, 12.0
-    sig_start_x_mm = tb_x_mm + tb_w_mm - sig_box_w_mm - 6.0
-    sig_start_y_mm = tb_y_mm + tb_h_mm + 6.0
-    for i in range(4):
-        sx_mm = sig_start_x_mm
-        sy_mm = sig_start_y_mm + i*(sig_box_h_mm + 4.0)
-        msp.add_lwpolyline([(sx_mm/1000.0, sy_mm/1000.0),
-                            ((sx_mm + sig_box_w_mm)/1000.0, sy_mm/1000.0),
-                            ((sx_mm + sig_box_w_mm)/1000.0, (sy_mm + sig_box_h_mm)/1000.0),
-                            (sx_mm/1000.0, (sy_mm + sig_box_h_mm)/1000.0),
-                            (sx_mm/1000.0, sy_mm/1000.0)],
-                           dxfattribs={"layer":"BORDER", "closed":True})
-
-    # ---------------- Save DXF to buffer ----------------
-    dxf_buf = io.BytesIO()
-    doc.write(dxf_buf)
-    dxf_buf.seek(0)
-
-    # ---------------- Render PDF from DXF (A3) ----------------
-    fig = plt.figure(figsize=(PAGE_W_MM/25.4, PAGE_H_MM/25.4), dpi=300)
-    ax = fig.add_axes([0,0,1,1])
-    ctx = RenderContext(doc)
-    backend = MatplotlibBackend(ax)
-    Frontend(ctx, backend).draw_layout(doc.modelspace())
-    ax.set_axis_off()
-    pdf_buf = io.BytesIO()
-    fig.savefig(pdf_buf, format="pdf", bbox_inches="tight", dpi=300)
-    plt.close(fig)
-    pdf_buf.seek(0)
-
-    # ---------------- Streamlit downloads ----------------
-    st.success("DXF and PDF generated (DXF units = metres; PDF English-only).")
-    st.download_button("Download DXF", data=dxf_buf.getvalue(), file_name=f"Single_Site_{survey_no or 'site'}.dxf", mime="application/dxf")
-    st.download_button("Download PDF", data=pdf_buf.getvalue(), file_name=f"Single_Site_{survey_no or 'site'}.pdf", mime="application/pdf")
-
-    # ---------------- Cleanup temporary image files created ----------------
-    # remove temp files created earlier (if any)
-    try:
-        for path in os.listdir(tempfile.gettempdir()):
-            if path.endswith(".png") and path.startswith("tmp"):
-                p = os.path.join(tempfile.gettempdir(), path)
-                # only remove files created in this process if safe (best-effort)
-                try:
-                    os.remove(p)
-                except Exception:
-                    pass
-    except Exception:
-        pass
+# ASCII stays the default: binary DXF opens in AutoCAD and ezdxf, but not in every viewer
+dxf_binary = st.checkbox("Binary DXF (smaller, faster; AutoCAD / ezdxf)", value=False)
+
+# all inputs that affect the sheet, hashed into one key for the last-generated artifacts
+plan_params = (survey_no, village, taluk, epid, ward_no, constituency, total_builtup,
+               site_length_m, site_width_m, road_info, picked_latlon[0], picked_latlon[1],
+               kp_zoom, kp_radius_m, adlr_zoom, adlr_buffer_m, dxf_binary)
+plan_key = hashlib.blake2b(repr(plan_params).encode(), digest_size=16).hexdigest()
+
+# the PDF render is the slow part, so DXF-only users can skip it
+col1, col2 = st.columns(2)
+gen_dxf = col1.button("Generate DXF")
+gen_pdf = col2.button("Generate DXF + PDF")
+
+# keep offering the downloads on later reruns (e.g. after a download click) while inputs are unchanged;
+# a repeated click only rebuilds if it asks for a PDF the stored artifacts don't have
+artifacts = st.session_state.get("artifacts")
+if artifacts and artifacts[0] != plan_key:
+    artifacts = None
+# a PDF still rendering is kept as (plan_key, future), so a rerun (e.g. clicking Download DXF
+# mid-render) picks the same render back up instead of losing it
+pdf_job = st.session_state.get("pdf_job")
+if pdf_job and pdf_job[0] != plan_key:
+    pdf_job = st.session_state["pdf_job"] = None
+if (gen_dxf or gen_pdf) and not (artifacts and (artifacts[2] is not None or not gen_pdf or pdf_job)):
+    doc, map_images = build_sheet(*plan_params[:-1])
+    # write the DXF first: Drawing.write() updates header vars, classes and metadata objects, and
+    # ezdxf is not thread-safe, so only the finished document is handed to the PDF thread
+    artifacts = st.session_state["artifacts"] = (plan_key, write_dxf(doc, dxf_binary), None)
+    if gen_pdf:
+        pdf_job = st.session_state["pdf_job"] = (plan_key, _pdf_pool().submit(render_pdf, doc, map_images))
+
+if artifacts:
+    _, dxf_bytes, pdf_bytes = artifacts
+
+    # ---------------- Streamlit downloads (DXF first; the PDF button appears once its render is done) ----------------
+    st.success("DXF generated (DXF units = metres).")
+    st.download_button("Download DXF", data=dxf_bytes, file_name=f"Single_Site_{survey_no or 'site'}.dxf", mime="application/dxf")
+    if pdf_job and pdf_bytes is None:
+        pdf_future = pdf_job[1]
+        # the script thread waits here (the render itself runs on _pdf_pool), but the DXF button above is
+        # already live; a click queues a rerun that Streamlit applies at the next st.* call
+        with st.status("Rendering PDF...", expanded=False) as status:
+            while not pdf_future.done():
+                time.sleep(0.1)
+            # settle session_state before any st.* call, so a queued rerun can't drop the finished PDF
+            pdf_error = pdf_future.exception()
+            if pdf_error is None:
+                pdf_bytes = pdf_future.result()
+                st.session_state["artifacts"] = (plan_key, dxf_bytes, pdf_bytes)
+            st.session_state["pdf_job"] = None
+            if pdf_error is None:
+                status.update(label="PDF rendered (English-only).", state="complete")
+            else:
+                status.update(label=f"PDF render failed: {pdf_error}", state="error")
+    if pdf_bytes is not None:
+        st.download_button("Download PDF", data=pdf_bytes, file_name=f"Single_Site_{survey_no or 'site'}.pdf", mime="application/pdf")